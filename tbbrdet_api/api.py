@@ -4,8 +4,11 @@ Functions to integrate the submodule TBBRDet model with the DEEPaaS API.
 This file is minimal, only performing the interfacing tasks, so as not to
 mix the "true" code with DEEPaaS code.
 """
+import argparse
+from functools import lru_cache
 import logging
 import os
+import time
 from torch import cuda
 from pathlib import Path
 # from PIL import Image
@@ -16,11 +19,23 @@ from tbbrdet_api.scripts.infer import infer
 from tbbrdet_api.misc import (
     _catch_error, extract_zst,
     copy_file,
-    ls_folders,
+    ls_folders, invalidate_ls_cache, LS_CACHE_TTL,
 )
 
 logger = logging.getLogger('__name__')
 
+# package metadata doesn't change while the API is running
+_STATIC_METADATA = {
+    'api_name': configs.API_METADATA.get("name"),
+    'model_name': configs.MODEL_METADATA.get("name"),
+    'api_authors': configs.API_METADATA.get("author"),
+    'model_authors': configs.MODEL_METADATA.get("author"),
+    'description': configs.MODEL_METADATA.get("summary"),
+    'home_page': configs.API_METADATA.get("home_page"),
+    'license': configs.API_METADATA.get("license"),
+    'version': configs.API_METADATA.get("version"),
+}
+
 
 @_catch_error
 def get_metadata():
@@ -34,14 +49,7 @@ def get_metadata():
         A dictionary containing metadata information required by DEEPaaS.
     """
     metadata = {
-        'api_name': configs.API_METADATA.get("name"),
-        'model_name': configs.MODEL_METADATA.get("name"),
-        'api_authors': configs.API_METADATA.get("author"),
-        'model_authors': configs.MODEL_METADATA.get("author"),
-        'description': configs.MODEL_METADATA.get("summary"),
-        'home_page': configs.API_METADATA.get("home_page"),
-        'license': configs.API_METADATA.get("license"),
-        'version': configs.API_METADATA.get("version"),
+        **_STATIC_METADATA,
         'datasets_LOCAL': ls_folders(configs.DATA_PATH, '*.npy'),
         'datasets_REMOTE': [str(p) for p in
                             configs.REMOTE_DATA_PATH.glob("[!.]*")],
@@ -63,7 +71,8 @@ def get_train_args():
     Returns:
         Dictionary of webargs fields.
       """
-    train_args = fields.TrainArgsSchema().fields
+    train_args = _schema_fields(fields.TrainArgsSchema,
+                                int(time.time() // LS_CACHE_TTL))
     logger.debug("Web arguments: %s", train_args)
     return train_args
 
@@ -75,11 +84,21 @@ def get_predict_args():
     Returns:
         Dictionary of webargs fields.
     """
-    predict_args = fields.PredictArgsSchema().fields
+    predict_args = _schema_fields(fields.PredictArgsSchema,
+                                  int(time.time() // LS_CACHE_TTL))
     logger.debug("Web arguments: %s", predict_args)
     return predict_args
 
 
+@lru_cache(maxsize=4)
+def _schema_fields(schema, time_bucket: int):
+    """
+    Return the fields of the provided schema, reusing them for calls within
+    the same time_bucket (i.e. as long as the listed model folders are cached).
+    """
+    return schema().fields
+
+
 def train(**args):
     """
     Performs training on the dataset.
@@ -112,7 +131,7 @@ def train(**args):
                     f"contains .tar.zst files to extract, "
                     f"extracting them into '{configs.DATA_PATH}'...")
         # handle zipped image numpy files through extraction
-        extract_zst(Path(args['dataset_path']))
+        extract_zst(Path(args['dataset_path']), tar_zst_paths)
 
         # handle annotation files through moving to destination directory
         for json_path in json_paths:
@@ -155,6 +174,10 @@ def train(**args):
 
     model_dir = main(args)
 
+    # new local model folder (and possibly data) is listed on next request
+    invalidate_ls_cache()
+    _schema_fields.cache_clear()
+
     return {f'Model and logs were saved to {model_dir}'}
 
 
@@ -196,29 +219,45 @@ def predict(**args):
 
 
 if __name__ == '__main__':
-    ex_args = {
-        'dataset_path': '/srv/tbbrdet_api/data/',
-        'architecture': 'swin',
-        'train_from': '/storage/tbbrdet/models/swin/coco/2023-05-10_103541/',
-        # 'scratch',
-        'device': True,
-        'epochs': 1,
-        'workers': 2,
-        'batch': 1,
-        'lr': 0.0001,
-        'seed': 42,
-        'eval': "bbox"
-    }
-    train(**ex_args)
-
-    ex_args = {
-        'input':
-            '/srv/tbbrdet_api/data/test/images/Flug1_105Media/DJI_0004_R.npy',
-        'predict_model_dir':
-            '/srv/tbbrdet_api/models/swin/coco/2023-11-14_085259/',
-        'colour_channel': 'both',
-        'threshold': 0.3,
-        'device': True,
-        'accept': 'image/png'
-    }
-    predict(**ex_args)
+    parser = argparse.ArgumentParser(
+        description="Run the example training and/or prediction. Without "
+                    "arguments, only the metadata is printed."
+    )
+    parser.add_argument("--train", action="store_true",
+                        help="Run the example training.")
+    parser.add_argument("--predict", action="store_true",
+                        help="Run the example prediction.")
+    cli_args = parser.parse_args()
+
+    if not (cli_args.train or cli_args.predict):
+        print(get_metadata())
+
+    if cli_args.train:
+        ex_args = {
+            'dataset_path': '/srv/tbbrdet_api/data/',
+            'architecture': 'swin',
+            'train_from':
+                '/storage/tbbrdet/models/swin/coco/2023-05-10_103541/',
+            # 'scratch',
+            'device': True,
+            'epochs': 1,
+            'workers': 2,
+            'batch': 1,
+            'lr': 0.0001,
+            'seed': 42,
+            'eval': "bbox"
+        }
+        train(**ex_args)
+
+    if cli_args.predict:
+        ex_args = {
+            'input': '/srv/tbbrdet_api/data/test/images/Flug1_105Media/'
+                     'DJI_0004_R.npy',
+            'predict_model_dir':
+                '/srv/tbbrdet_api/models/swin/coco/2023-11-14_085259/',
+            'colour_channel': 'both',
+            'threshold': 0.3,
+            'device': True,
+            'accept': 'image/png'
+        }
+        predict(**ex_args)
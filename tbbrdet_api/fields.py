@@ -53,9 +53,7 @@ class TrainArgsSchema(Schema):
     train_from = fields.Str(
         required=True,
         metadata={
-            'enum': (configs.TRAIN_OPTIONS
-                     + ls_folders(configs.MODEL_PATH)
-                     + ls_folders(configs.REMOTE_MODEL_PATH)),
+            # 'enum' with the model folders is added in __init__
             'description': 'Options for training model: from scratch, '
                            'from pretrained weights (transfer learning), or '
                            'resume the training of a previously trained '
@@ -109,6 +107,17 @@ class TrainArgsSchema(Schema):
         }
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # list model folders on instantiation rather than on import
+        # (new metadata dict, as field copies share it with the class)
+        field = self.fields['train_from']
+        field.metadata = dict(field.metadata, enum=(
+            configs.TRAIN_OPTIONS
+            + ls_folders(configs.MODEL_PATH)
+            + ls_folders(configs.REMOTE_MODEL_PATH)
+        ))
+
     @validates_schema
     def validate_required_fields(self, data):
         if data['device'] is False:
@@ -153,11 +162,8 @@ class PredictArgsSchema(Schema):
             'description':
                 'Model to be used for prediction. If only remote folders are '
                 'available, the chosen one will be used and predictions saved '
-                'remotely.\n\nCurrently existing "best" model paths are'
-                '\n- locally:\n'
-                f'{ls_folders(configs.MODEL_PATH, "best*.pth")}'
-                '\n- remotely:\n'
-                f'{ls_folders(configs.REMOTE_MODEL_PATH, "best*.pth")}\n'
+                'remotely.'
+            # existing "best" model paths are added in __init__
         }
     )
 
@@ -205,6 +211,20 @@ class PredictArgsSchema(Schema):
         }
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # list model folders on instantiation rather than on import
+        # (new metadata dict, as field copies share it with the class)
+        field = self.fields['predict_model_dir']
+        field.metadata = dict(field.metadata, description=(
+            f'{field.metadata["description"]}'
+            '\n\nCurrently existing "best" model paths are'
+            '\n- locally:\n'
+            f'{ls_folders(configs.MODEL_PATH, "best*.pth")}'
+            '\n- remotely:\n'
+            f'{ls_folders(configs.REMOTE_MODEL_PATH, "best*.pth")}\n'
+        ))
+
 
 if __name__ == '__main__':
     pass
@@ -3,24 +3,44 @@ This file gathers some utility functions for all other scripts
 (get_metadata, training and inference).
 """
 
-from functools import wraps
+from collections import deque
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+)
+from fnmatch import fnmatch
+from functools import lru_cache, partial, wraps
 import logging
+import multiprocessing
+import os
+import selectors
 import subprocess
 from subprocess import TimeoutExpired
 import time
-import threading
 from pathlib import Path
-import sys
 import shutil
+import tarfile
 
+import zstandard as zstd
 from aiohttp.web import HTTPBadRequest, HTTPException
+from tqdm import tqdm
 
 from tbbrdet_api import configs
 
 logger = logging.getLogger('__name__')
 logger.setLevel(configs.LOG_LEVEL)      # previously: logging.DEBUG
 
-stop_thread = threading.Event()
+# streaming buffer, disk check frequency and parallel workers for file I/O
+ZST_READ_SIZE = 4 * 1024 * 1024
+TAR_BUFSIZE = 1024 * 1024
+ZST_CHECK_EVERY = 500
+ZST_MAX_WORKERS = 8
+LS_MAX_WORKERS = 16
+STDERR_TAIL_CHUNKS = 16
+
+# seconds between disk space checks and reuse of folder scan results
+MONITOR_INTERVAL = 1
+DISK_USAGE_TTL = 5
+LS_CACHE_TTL = 300
 
 
 class DiskSpaceExceeded(Exception):
@@ -31,15 +51,17 @@ class DiskSpaceExceeded(Exception):
 def _catch_error(f):
     """
     Decorate API functions to return an error as HTTPBadRequest,
-    in case it fails.
+    in case it fails. HTTP errors are passed through unchanged.
     """
 
     @wraps(f)
     def wrap(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except HTTPException:
+            raise
         except Exception as e:
-            raise HTTPBadRequest(reason=e)
+            raise HTTPBadRequest(reason=str(e)) from e
 
     return wrap
 
@@ -79,35 +101,172 @@ def set_log(log_dir):
     logging.getLogger().addHandler(console)
 
 
-def extract_zst(zst_folder: Path = configs.DATA_PATH):
+def extract_zst(zst_folder: Path = configs.DATA_PATH, zst_paths: list = None):
     """
-    Extracting the files from the tar.zst files
+    Extracting the files from the tar.zst files.
+    Archives are independent of each other, so they are extracted in
+    parallel worker processes (see _extract_one).
 
     Args:
         zst_folder (Path): Path to folder containing .tar.zst files to extract
+        zst_paths (list): Already collected .tar.zst files in zst_folder,
+            to avoid scanning the folder again
 
-    Returns:
-        limit_exceeded (Bool): True if no more data is allowed to be extracted
-
+    Raises:
+        DiskSpaceExceeded: If disk space limit exceeded during extraction
     """
     log_disk_usage("Begin extracting .tar.zst files")
 
-    for zst_path in Path(zst_folder).glob("**/*.tar.zst"):
-        tar_command = ["tar", "-I", "zstd", "-xf",  # -v flag to print names
-                       str(zst_path), "-C", str(configs.DATA_PATH)]
+    if zst_paths is None:
+        zst_paths = list(Path(zst_folder).rglob("*.tar.zst"))
+    if not zst_paths:
+        return
+
+    # get absolute limit by comparing to remaining available space on node
+    limit_gb = check_available_node_space(configs.DATA_LIMIT_GB)
+
+    # compressed archive sizes are a lower bound of the extracted data size
+    # (archives in DATA_PATH are already part of its current usage)
+    zst_gb = sum(p.stat().st_size for p in zst_paths
+                 if Path(configs.DATA_PATH) not in p.parents) / (1024 ** 3)
+    start_gb = get_disk_usage(Path(configs.DATA_PATH))
+    if start_gb + zst_gb > limit_gb:
+        log_disk_usage("FAILED: extracting .tar.zst files")
+        logger.error(f"Disk space limit of {limit_gb} GB would be exceeded "
+                     f"by extracting {len(zst_paths)} .tar.zst files!")
+        raise DiskSpaceExceeded(
+            f"Disk space limit of {limit_gb} GB would be exceeded "
+            f"by extracting {len(zst_paths)} .tar.zst files!")
+
+    # spawn workers, as forking the multi-threaded API process is unsafe
+    max_workers = min(ZST_MAX_WORKERS, len(zst_paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")) as executor:
+        # workers track usage growth via the filesystem from these values,
+        # which includes what the other workers write
+        extract_one = partial(_extract_one, data_path=Path(configs.DATA_PATH),
+                              limit_gb=limit_gb, start_gb=start_gb,
+                              start_fs_gb=_fast_used_gb(configs.DATA_PATH))
+        futures = {executor.submit(extract_one, zst_path): zst_path
+                   for zst_path in zst_paths}
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures),
+                               desc="Extracting .tar.zst files"):
+                future.result()
+
+                # if zst file is in config.DATA_PATH, delete to save space
+                zst_path = futures[future]
+                if Path(configs.DATA_PATH) in zst_path.parents:
+                    logger.info(f"Removing .tar.zst file '{zst_path.name}' "
+                                f"after extraction to save storage space.")
+                    zst_path.unlink()
+        except BaseException:
+            # don't start extracting the remaining archives
+            for future in futures:
+                future.cancel()
+            raise
+
+    log_disk_usage("Finished: extracting .tar.zst files")
+
+
+def _extract_one(zst_path: Path, data_path: Path, limit_gb: float,
+                 start_gb: float, start_fs_gb: float):
+    """
+    Extract a single .tar.zst file into data_path.
+    The archive is decompressed and untarred in a single streaming pass
+    in-process, instead of forking a 'tar -I zstd' subprocess.
+    Defined at module level so it can be pickled to worker processes.
+
+    Args:
+        zst_path (Path): Path to the .tar.zst file to extract
+        data_path (Path): Path to extract to (i.e. configs.DATA_PATH)
+        limit_gb (float): Limit on the disk space of data_path
+        start_gb (float): Disk space of data_path before the extraction
+        start_fs_gb (float): Used filesystem space before the extraction
+
+    Raises:
+        DiskSpaceExceeded: If disk space limit exceeded during extraction
+    """
+    print(f"=================================\n"
+          f"Running unpacking '{zst_path.name}'\n"
+          f"=================================")    # logger.info
+
+    with open(zst_path, "rb") as fh, \
+            zstd.ZstdDecompressor().stream_reader(
+                fh, read_size=ZST_READ_SIZE) as reader, \
+            tarfile.open(fileobj=reader, mode="r|",
+                         bufsize=TAR_BUFSIZE) as tar:
+
+        for i, member in enumerate(tar):
+            _extract_member(tar, member, data_path)
+
+            if i % ZST_CHECK_EVERY != 0:
+                continue
+
+            stored_gb = start_gb + _fast_used_gb(data_path) - start_fs_gb
+            if stored_gb > limit_gb:
+                raise DiskSpaceExceeded(
+                    f"Disk space limit of {limit_gb} GB exceeded "
+                    f"while unpacking '{zst_path.name}'!")
+
+    print(f"Finished unpacking '{zst_path.name}'")    # logger.info
+
+
+def _extract_member(tar: tarfile.TarFile, member: tarfile.TarInfo,
+                    path: Path):
+    """
+    Extract a single tar member into path, refusing members that would be
+    written (or link) outside of it, e.g. through '..' parts.
+    Owner, permission and mtime updates are skipped (like tar's
+    --no-same-owner --no-same-permissions) for the data files.
+
+    Raises:
+        tarfile.TarError: If the member would be extracted outside of path
+    """
+    if hasattr(tarfile, "data_filter"):
+        # filter beforehand to create the folders below from the safe name
+        try:
+            member = tarfile.data_filter(member, str(path))
+        except tarfile.FilterError as e:
+            # filter errors can't be unpickled from the worker processes
+            raise tarfile.TarError(str(e)) from e
+        extract_kwargs = {"filter": "data"}
+    else:
+        # older Python versions without extraction filters
+        _check_member_path(member, path)
+        extract_kwargs = {}
+
+    # parallel workers extract into the same folders, but tarfile creates
+    # missing parent folders without exist_ok, so create them here
+    Path(path, member.name).parent.mkdir(parents=True, exist_ok=True)
+    tar.extract(member, path=path, set_attrs=False, **extract_kwargs)
+
+
+def _check_member_path(member: tarfile.TarInfo, path: Path):
+    """
+    Check that a tar member and its link target stay inside of path.
+
+    Raises:
+        tarfile.TarError: If the member would be extracted outside of path
+    """
+    dest = os.path.realpath(path)
+
+    def is_inside(target: str):
+        target = os.path.realpath(os.path.join(dest, target))
+        return os.path.commonpath([dest, target]) == dest
 
-        run_subprocess(
-            tar_command,
-            process_message=f"unpacking '{zst_path.name}'",
-            limit_gb=configs.DATA_LIMIT_GB,
-            path_to_check=configs.DATA_PATH
-        )
+    link_target = None
+    if member.issym():
+        link_target = os.path.join(os.path.dirname(member.name),
+                                   member.linkname)
+    elif member.islnk():
+        link_target = member.linkname
 
-        # check if zst file is in config.DATA_PATH, if so delete to save space
-        if configs.DATA_PATH in zst_path.parents:
-            logger.info(f"Removing .tar.zst file '{zst_path.name}' "
-                        f"after extraction to save storage space.")
-            zst_path.unlink()
+    if not is_inside(member.name) or (link_target is not None
+                                      and not is_inside(link_target)):
+        raise tarfile.TarError(f"Refusing to extract '{member.name}' "
+                               f"outside of '{path}'!")
 
 
 def ls_folders(directory: Path = configs.MODEL_PATH,
@@ -128,8 +287,43 @@ def ls_folders(directory: Path = configs.MODEL_PATH,
     Returns:
         list: list of relevant .pth file paths
     """
+    return list(_ls_folders_cached(str(directory), pattern,
+                                   int(time.time() // LS_CACHE_TTL)))
+
+
+@lru_cache(maxsize=16)
+def _ls_folders_cached(directory: str, pattern: str, time_bucket: int):
+    """Scan the directory, reusing the result for calls within the same
+    time_bucket (i.e. within LS_CACHE_TTL seconds).
+
+    Top-level subfolders are scanned in parallel threads, as listing
+    (remotely mounted) directories is I/O-bound.
+    """
     logger.debug(f"Scanning through '{directory}' with pattern '{pattern}'")
-    return sorted(set([str(d.parent) for d in Path(directory).rglob(pattern)]))
+    if not Path(directory).is_dir():
+        return ()
+
+    top_dirs, folders = [], set()
+    for p in Path(directory).iterdir():
+        if p.is_dir():
+            top_dirs.append(p)
+        elif fnmatch(p.name, pattern):
+            folders.add(str(p.parent))
+
+    with ThreadPoolExecutor(max_workers=LS_MAX_WORKERS) as executor:
+        for found in executor.map(
+                lambda d: [str(f.parent) for f in d.rglob(pattern)],
+                top_dirs):
+            folders.update(found)
+
+    return tuple(sorted(folders))
+
+
+def invalidate_ls_cache():
+    """Clear cached ls_folders results, i.e. after new models or data were
+    saved locally.
+    """
+    _ls_folders_cached.cache_clear()
 
 
 def get_weights_folder(data: dict):
@@ -202,48 +396,69 @@ def run_subprocess(command: list, process_message: str,
     # get absolute limit by comparing to remaining available space on node
     limit_gb = check_available_node_space(limit_gb)
 
-    if get_disk_usage(folder=path_to_check) > limit_gb:
+    start_gb = get_disk_usage(folder=path_to_check)
+    if start_gb > limit_gb:
         log_disk_usage(f"FAILED: {process_message}")
         logger.error(f"Disk space limit of {limit_gb} GB exceeded "
                      f"before {process_message} subprocess can start!")
         raise DiskSpaceExceeded(f"Disk space limit of {limit_gb} GB exceeded "
                                 f"before {process_message} process can start!")
 
+    print(f"=================================\n"
+          f"Running {process_message} command:\n'{str_command}'\n"
+          f"=================================")    # logger.info
+
+    # stderr is streamed (keeping only its tail) while checking timeout and
+    # disk usage, so the child can't block on a full pipe buffer
+    process = subprocess.Popen(      # nosec
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+    )
+    err_tail = deque(maxlen=STDERR_TAIL_CHUNKS)
+    selector = selectors.DefaultSelector()
+    selector.register(process.stderr, selectors.EVENT_READ)
+
+    def read_stderr(select_timeout: float):
+        """Append available stderr output to err_tail, False if none."""
+        events = selector.select(timeout=select_timeout)
+        for key, _ in events:
+            chunk = os.read(key.fd, 64 * 1024)
+            if chunk:
+                err_tail.append(chunk)
+            else:   # EOF, the child closed its stderr
+                selector.unregister(key.fileobj)
+        return bool(events)
+
+    start_fs_gb = _fast_used_gb(path_to_check)
+    deadline = time.monotonic() + timeout
+
     try:
-        # monitor disk space usage in the background
-        monitor_thread = threading.Thread(target=monitor_disk_space,
-                                          args=(limit_gb, path_to_check, ),
-                                          daemon=True)
-        monitor_thread.start()
-        print(f"=================================\n"
-              f"Running {process_message} command:\n'{str_command}'\n"
-              f"=================================")    # logger.info
-
-        process = subprocess.Popen(      # nosec
-                command,
-                stdout=subprocess.PIPE,  # Capture stdout
-                stderr=subprocess.PIPE,  # Capture stderr
-                universal_newlines=True,  # Return strings rather than bytes
-        )
-        return_code = process.wait(timeout=timeout)
-
-        if stop_thread.is_set():
-            log_disk_usage(f"FAILED: {process_message}")
-            raise DiskSpaceExceeded(
-                f"Disk space exceeded during {process_message} "
-                f"while running\n'{str_command}'\n")
-
-        if return_code == 0:
-            log_disk_usage(f"Finished: {process_message}")
-        else:
-            _, err = process.communicate()
-            print(f"Error while running '{str_command}' for {process_message}."
-                  f" Terminated with return code {return_code}.")  # log.error
-            process.terminate()
-            raise HTTPException(reason=err)  # works without TypeError?...
+        while process.poll() is None:
+            if selector.get_map():
+                read_stderr(MONITOR_INTERVAL)
+            else:   # stderr closed, only wait for the process to exit
+                try:
+                    process.wait(timeout=MONITOR_INTERVAL)
+                except TimeoutExpired:
+                    pass
+
+            if time.monotonic() > deadline:
+                raise TimeoutExpired(command, timeout)
+
+            stored_gb = start_gb + _fast_used_gb(path_to_check) - start_fs_gb
+            if stored_gb >= limit_gb:
+                log_disk_usage(f"FAILED: {process_message}")
+                raise DiskSpaceExceeded(
+                    f"Disk space exceeded during {process_message} "
+                    f"while running\n'{str_command}'\n")
+
+        # collect output written right before the process exited
+        while selector.get_map() and read_stderr(0):
+            pass
 
     except TimeoutExpired:
-        process.terminate()
+        process.kill()
         logger.error(f"Timeout during {process_message} while running"
                      f"\n'{str_command}'\n{timeout} seconds were exceeded.")
         raise
@@ -251,31 +466,33 @@ def run_subprocess(command: list, process_message: str,
         #  because it causes a TypeError: __init__ required ...
 
     except DiskSpaceExceeded as e:
-        process.terminate()
+        process.kill()
         logger.error(str(e))
         raise
         # NOTE: can't "raise HTTPServerError(reason=str(e))"
         #  because it causes a TypeError: __init__ required ..
 
-    return
-
-
-def monitor_disk_space(limit_gb: int, path_to_check: Path):
-    """
-    Thread function to monitor disk space and check the current usage
-    doesn't exceed the defined limit.
-
-    Raises:
-        DiskSpaceExceeded: If available disk space exceeded during threading
-    """
-    while True:
-        time.sleep(3)
-
-        stored_gb = get_disk_usage(Path(path_to_check))
+    finally:
+        # also stop the child on any other error (or KeyboardInterrupt)
+        if process.poll() is None:
+            process.kill()
+        selector.close()
+        process.stderr.close()
+        process.wait()
+
+    return_code = process.returncode
+    if return_code == 0:
+        log_disk_usage(f"Finished: {process_message}")
+    else:
+        err = b"".join(err_tail).decode(errors="replace")
+        logger.error(f"Error while running '{str_command}' for "
+                     f"{process_message}. Terminated with return code "
+                     f"{return_code}. Stderr:\n{err}")
+        # NOTE: aiohttp doesn't allow line breaks in the reason
+        raise HTTPException(reason=f"{process_message} failed with return "
+                                   f"code {return_code}")
 
-        if stored_gb >= limit_gb:
-            stop_thread.set()
-            sys.exit()
+    return
 
 
 def check_available_node_space(limit_gb: int = configs.LIMIT_GB):
@@ -291,16 +508,15 @@ def check_available_node_space(limit_gb: int = configs.LIMIT_GB):
     """
     try:
         # get available space on entire node (with additional buffer of 3 GB)
-        available_gb = int(subprocess.getoutput(
-            "df -h | grep 'overlay' | awk '{print $4}'"
-        ).split("G")[0])
-        available_gb = max(available_gb - 3, 0)
-    except ValueError as e:
-        logger.error(f"ValueError: Node disk space not readable. "
+        st = os.statvfs(configs.BASE_PATH)
+        available_gb = max(st.f_bavail * st.f_frsize // (1024 ** 3) - 3, 0)
+    except OSError as e:
+        logger.error(f"OSError: Node disk space not readable. "
                      f"Using provided limit of {limit_gb} GB.")
         raise HTTPException(reason=str(e)) from e
 
-    current_gb = get_disk_usage()
+    current_gb = _cached_disk_usage(configs.BASE_PATH,
+                                    int(time.time() // DISK_USAGE_TTL))
     leftover_gb = round(limit_gb - current_gb, 2)
     if leftover_gb < available_gb:
         return limit_gb
@@ -317,16 +533,53 @@ def get_disk_usage(folder: Path = configs.BASE_PATH):
     """Get the current amount of GB (rounded to two decimals) stored
     in the provided folder.
     """
-    return round(sum(f.stat().st_size for f in folder.rglob('*')
-                     if f.is_file()) / (1024 ** 3), 2)
+    return round(_walk_size(folder) / (1024 ** 3), 2)
+
+
+def _walk_size(path):
+    """Get the total size in bytes of all files in the provided folder,
+    using the cached file types of os.scandir entries.
+    Missing or unreadable folders and files count as 0 bytes.
+    """
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    try:
+                        total += entry.stat(follow_symlinks=False).st_size
+                    except (FileNotFoundError, PermissionError):
+                        pass    # file was removed during the walk
+                elif entry.is_dir(follow_symlinks=False):
+                    total += _walk_size(entry.path)
+    except (FileNotFoundError, PermissionError):
+        pass
+    return total
 
 
 def log_disk_usage(process_message: str):
     """Log used disk space to the terminal with a process_message describing
     what has occurred.
     """
+    current_gb = _cached_disk_usage(configs.BASE_PATH,
+                                    int(time.time() // DISK_USAGE_TTL))
     print(f"{process_message} --- Repository currently takes up "
-          f"{get_disk_usage()} GB.")  # logger.info
+          f"{current_gb} GB.")  # logger.info
+
+
+@lru_cache(maxsize=8)
+def _cached_disk_usage(folder: Path, time_bucket: int):
+    """Get the disk usage of the provided folder, reusing the result for
+    calls within the same time_bucket (i.e. within DISK_USAGE_TTL seconds).
+    """
+    return get_disk_usage(Path(folder))
+
+
+def _fast_used_gb(path: Path):
+    """Get the used GB of the entire filesystem containing the provided
+    path with a single statvfs call.
+    """
+    return shutil.disk_usage(str(path)).used / (1024 ** 3)
 
 
 if __name__ == '__main__':
@@ -10,6 +10,7 @@ Inference on provided data
 from aiohttp.web import HTTPError
 from pathlib import Path
 import logging
+import os
 import shutil
 
 import tbbrdet_api.configs as configs
@@ -17,6 +18,8 @@ from tbbrdet_api.misc import run_subprocess
 # --------------------------------------
 logger = logging.getLogger('__name__')
 
+COPY_BUFSIZE = 1024 * 1024
+
 
 def infer(args):
     """
@@ -36,7 +39,14 @@ def infer(args):
         # Input file is from a browsing webargs field
         tmp_filepath = Path(args['input'].filename)
         new_filepath = Path(configs.DATA_PATH, args['input'].original_filename)
-        shutil.copy(tmp_filepath, new_filepath)
+        try:
+            # renaming avoids copying if both are on the same filesystem
+            os.replace(tmp_filepath, new_filepath)
+        except OSError:
+            with open(tmp_filepath, "rb") as src, \
+                    open(new_filepath, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+            tmp_filepath.unlink()
         npy_paths = [new_filepath]
     except Exception as e:
         raise HTTPError(e)
@@ -73,7 +83,6 @@ def infer(args):
     # delete temporary files if webargs browsing field was used
     if 'new_filepath' in locals():
         new_filepath.unlink()
-        tmp_filepath.unlink()
 
     return result
 
@@ -54,17 +54,18 @@ def main(args):
     timestamp = datetime.now().strftime('%Y-%m-%d_%H%M%S')
     args['auto_resume'] = None
 
+    # new model folder, used if not resuming a previously trained model
+    new_model_dir = osp.join(
+        configs.MODEL_PATH, args['architecture'], args['train_from'], timestamp
+    )
+
     if args['train_from'] == "scratch":
         # TRAINING FROM SCRATCH
         print("----- We're training from scratch -----")
 
         args['conf'] = [str(p) for p in
                         submodule_config_path.glob("*coco.scratch.py")][-1]
-        args['model_dir'] = osp.join(
-            configs.MODEL_PATH, args['architecture'],
-            args['train_from'], timestamp
-        )
-        Path(args['model_dir']).mkdir(parents=True, exist_ok=True)
+        args['model_dir'] = new_model_dir
 
     elif args['train_from'] == "coco":
         # TRAINING FROM COCO PRETRAINED WEIGHTS
@@ -82,11 +83,7 @@ def main(args):
 
         args['conf'] = [str(p) for p in
                         submodule_config_path.glob("*coco.pretrained.py")][-1]
-        args['model_dir'] = osp.join(
-            configs.MODEL_PATH, args['architecture'],
-            args['train_from'], timestamp
-        )
-        Path(args['model_dir']).mkdir(parents=True, exist_ok=True)
+        args['model_dir'] = new_model_dir
         args['cfg_options']['load_from'] = str(weights_path)
 
     else:
@@ -147,6 +144,8 @@ def main(args):
             )
             args['cfg_options']['runner.max_epochs'] = 0 + user_epochs
 
+    Path(args['model_dir']).mkdir(parents=True, exist_ok=True)
+
     # Set logging file
     set_log(args['model_dir'])
     yaml_save(file_path=os.path.join(args['model_dir'], 'options.yaml'),
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Tests to check if the utility functions run correctly.
+
+These tests will run in the Jenkins pipeline after each change
+made to the code.
+"""
+
+import io
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import zstandard as zstd
+from aiohttp.web import HTTPException
+
+import tbbrdet_api.misc as misc
+
+
+def _write_tar_zst(zst_path: Path, files: dict):
+    """Write a .tar.zst archive with the provided {name: bytes} files,
+    without directory entries (like archives with shared folders).
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    zst_path.write_bytes(zstd.ZstdCompressor().compress(buffer.getvalue()))
+
+
+class TestExtractZst(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.zst_dir = Path(self.tmp_dir.name, "zst")
+        self.data_dir = Path(self.tmp_dir.name, "data")
+        self.zst_dir.mkdir()
+        self.data_dir.mkdir()
+
+        # several archives sharing the same nested folders
+        self.expected = {}
+        for i in range(8):
+            files = {
+                f"train/images/deep/sub0/img_{i}.npy": bytes([i]) * 100,
+                f"test/images/deep/sub0/img_{i}.npy": bytes([i]) * 50,
+            }
+            _write_tar_zst(Path(self.zst_dir, f"part_{i}.tar.zst"), files)
+            self.expected.update(files)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_extract_zst_shared_folders(self):
+        """
+        Test that extract_zst() extracts all archives with shared folders
+        """
+        # use several workers, also on machines with a single CPU
+        with mock.patch.object(misc.configs, "DATA_PATH", self.data_dir), \
+                mock.patch.object(misc.os, "cpu_count", return_value=8):
+            misc.extract_zst(self.zst_dir)
+
+        for name, data in self.expected.items():
+            self.assertEqual(Path(self.data_dir, name).read_bytes(), data)
+        # archives outside of DATA_PATH are kept
+        self.assertEqual(len(list(self.zst_dir.glob("*.tar.zst"))), 8)
+
+    def test_extract_zst_in_data_path(self):
+        """
+        Test that archives inside DATA_PATH are removed after extraction
+        """
+        zst_dir = Path(self.data_dir, "zst")
+        self.zst_dir.rename(zst_dir)
+
+        with mock.patch.object(misc.configs, "DATA_PATH", self.data_dir):
+            misc.extract_zst(zst_dir)
+
+        for name, data in self.expected.items():
+            self.assertEqual(Path(self.data_dir, name).read_bytes(), data)
+        self.assertEqual(list(zst_dir.glob("*.tar.zst")), [])
+
+    def test_extract_zst_outside_path(self):
+        """
+        Test that members extracting outside of DATA_PATH are refused
+        """
+        _write_tar_zst(Path(self.zst_dir, "evil.tar.zst"),
+                       {"../evil.npy": b"evil"})
+
+        with mock.patch.object(misc.configs, "DATA_PATH", self.data_dir):
+            with self.assertRaises(tarfile.TarError):
+                misc.extract_zst(self.zst_dir)
+        self.assertFalse(Path(self.tmp_dir.name, "evil.npy").exists())
+
+
+class TestGetDiskUsage(unittest.TestCase):
+    def test_get_disk_usage_missing_folder(self):
+        """
+        Test that a folder that doesn't exist (yet) takes up 0 GB
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.assertEqual(misc.get_disk_usage(Path(tmp_dir, "missing")),
+                             0)
+
+
+class TestRunSubprocess(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.processes = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_subprocess(self, command, **kwargs):
+        """Run misc.run_subprocess and keep the started processes."""
+        real_popen = subprocess.Popen
+
+        def popen(*args, **popen_kwargs):
+            self.processes.append(real_popen(*args, **popen_kwargs))
+            return self.processes[-1]
+
+        with mock.patch.object(misc.subprocess, "Popen", side_effect=popen):
+            misc.run_subprocess(command, process_message="test",
+                                path_to_check=Path(self.tmp_dir.name),
+                                **kwargs)
+
+    def test_run_subprocess_large_stderr(self):
+        """
+        Test that a lot of stderr output doesn't block the subprocess
+        """
+        self.run_subprocess(
+            ["bash", "-c", "head -c 5000000 /dev/zero >&2"], timeout=30
+        )
+        self.assertEqual(self.processes[0].returncode, 0)
+
+    def test_run_subprocess_timeout(self):
+        """
+        Test that exceeding the timeout raises and stops the subprocess
+        """
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.run_subprocess(["sleep", "30"], timeout=1)
+        self.assertIsNotNone(self.processes[0].poll())
+
+    def test_run_subprocess_error(self):
+        """
+        Test that a failing subprocess raises and logs its stderr
+        """
+        with self.assertLogs(misc.logger, "ERROR") as logs, \
+                self.assertRaises(HTTPException) as cm:
+            self.run_subprocess(["bash", "-c", "echo boom >&2; exit 3"])
+
+        self.assertEqual(cm.exception.reason,
+                         "test failed with return code 3")
+        self.assertIn("boom", "\n".join(logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()